@@ -5,13 +5,23 @@ import argparse
 import hashlib
 import json
 import os
+import re
 import sys
-from datetime import date, datetime, timezone
+from datetime import date, datetime, time, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
-from urllib.parse import urlparse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
 
 ALLOWED_STATUSES = {"OK", "WARN", "FAIL"}
+# datetime.fromisoformat only accepts a trailing "Z" from Python 3.11 onwards.
+NEEDS_Z_SUFFIX_REWRITE = sys.version_info < (3, 11)
+# RFC 3986 scheme prefix; this is all urlparse needed to report a non-empty scheme.
+URI_SCHEME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9+.\-]*:")
 
 
 def now_utc() -> datetime:
@@ -37,9 +47,10 @@ def parse_dt(value: str | None) -> datetime | None:
         return None
     try:
         if len(text) == 10 and text[4] == "-" and text[7] == "-":
-            parsed = date.fromisoformat(text)
-            return datetime(parsed.year, parsed.month, parsed.day, tzinfo=timezone.utc)
-        parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+            return datetime.combine(date.fromisoformat(text), time.min, tzinfo=timezone.utc)
+        if NEEDS_Z_SUFFIX_REWRITE and text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        parsed = datetime.fromisoformat(text)
         if parsed.tzinfo is None:
             return parsed.replace(tzinfo=timezone.utc)
         return parsed.astimezone(timezone.utc)
@@ -47,6 +58,12 @@ def parse_dt(value: str | None) -> datetime | None:
         return None
 
 
+def load_json(text: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
 def to_float(value: Any) -> float | None:
     try:
         if value is None or value == "":
@@ -66,7 +83,7 @@ def parse_json_arg(value: str | None, default: Any) -> Any:
             return default
         text = path.read_text(encoding="utf-8")
     try:
-        return json.loads(text)
+        return load_json(text)
     except json.JSONDecodeError:
         return default
 
@@ -114,11 +131,7 @@ def parse_artifacts(values: list[str]) -> list[dict[str, str]]:
 
 
 def is_valid_uri(value: str) -> bool:
-    try:
-        parsed = urlparse(value)
-        return bool(parsed.scheme)
-    except Exception:
-        return False
+    return URI_SCHEME_RE.match(value) is not None
 
 
 def normalize_artifacts(value: Any) -> list[dict[str, str]]:
@@ -138,6 +151,19 @@ def normalize_artifacts(value: Any) -> list[dict[str, str]]:
     return normalized
 
 
+def collect_warnings(*sources: list[Any]) -> list[str]:
+    warnings: list[str] = []
+    seen: set[str] = set()
+    for source in sources:
+        for item in source:
+            text = str(item).strip()
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            warnings.append(text)
+    return warnings
+
+
 def normalize_checks(value: Any) -> list[dict[str, Any]]:
     if not isinstance(value, list):
         return []
@@ -172,25 +198,37 @@ def schema_hash(schema_path: str | None, explicit_hash: str | None) -> str | Non
     file = Path(schema_path)
     if not file.exists():
         return None
-    digest = hashlib.sha256(file.read_bytes()).hexdigest()
-    return digest
-
-
-def run_metadata() -> dict[str, Any]:
-    repo = os.environ.get("GITHUB_REPOSITORY")
-    run_id = os.environ.get("GITHUB_RUN_ID")
-    server = os.environ.get("GITHUB_SERVER_URL", "https://github.com")
+    with file.open("rb") as fh:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(fh, "sha256").hexdigest()
+        digest = hashlib.sha256()
+        while chunk := fh.read(1 << 20):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def read_run_metadata() -> dict[str, Any]:
+    env = os.environ
+    repo = env.get("GITHUB_REPOSITORY")
+    run_id = env.get("GITHUB_RUN_ID")
+    server = env.get("GITHUB_SERVER_URL", "https://github.com")
     run_url = f"{server}/{repo}/actions/runs/{run_id}" if repo and run_id else None
     return {
         "repo": repo,
         "run_id": run_id,
         "run_url": run_url,
-        "workflow": os.environ.get("GITHUB_WORKFLOW"),
-        "job": os.environ.get("GITHUB_JOB"),
-        "sha": os.environ.get("GITHUB_SHA"),
+        "workflow": env.get("GITHUB_WORKFLOW"),
+        "job": env.get("GITHUB_JOB"),
+        "sha": env.get("GITHUB_SHA"),
     }
 
 
+def run_metadata() -> dict[str, Any]:
+    # The GitHub Actions environment is fixed for the life of the process, so read it once.
+    return read_run_metadata().copy()
+
+
 def load_inputs(value: str | None) -> dict[str, Any]:
     if not value:
         return {}
@@ -222,28 +260,15 @@ def build_probe(args: argparse.Namespace) -> dict[str, Any]:
     if lag_seconds is None and max_dt:
         lag_seconds = max(0.0, (current - max_dt).total_seconds())
 
-    warnings = [item for item in args.warning if item.strip()]
-    warnings.extend(
-        [str(item).strip() for item in ensure_list(parse_json_arg(args.warnings_json, []))]
-        if args.warnings_json
-        else []
+    warnings = collect_warnings(
+        args.warning,
+        ensure_list(parse_json_arg(args.warnings_json, [])),
+        ensure_list(inputs.get("warnings")),
     )
-    warnings.extend(
-        [str(item).strip() for item in ensure_list(inputs.get("warnings")) if str(item).strip()]
+
+    key_checks = normalize_checks(
+        ensure_list(inputs.get("key_checks")) + ensure_list(parse_json_arg(args.key_checks_json, []))
     )
-    warnings = [item for item in warnings if item]
-    warnings = list(dict.fromkeys(warnings))
-
-    key_checks = normalize_checks(inputs.get("key_checks"))
-    checks_json = parse_json_arg(args.key_checks_json, [])
-    key_checks.extend(normalize_checks(checks_json))
-    key_checks = normalize_checks(key_checks)
-
-    artifacts: list[dict[str, str]] = []
-    artifacts.extend(normalize_artifacts(inputs.get("artifact_links")))
-    artifacts.extend(parse_artifacts(args.artifact))
-    artifacts.extend(normalize_artifacts(parse_json_arg(args.artifacts_json, []) if args.artifacts_json else []))
-    normalized_artifacts = normalize_artifacts(artifacts)
 
     meta = input_meta.copy()
     runtime_meta = run_metadata()
@@ -253,10 +278,14 @@ def build_probe(args: argparse.Namespace) -> dict[str, Any]:
         else:
             meta.setdefault(key, None)
 
+    artifacts: list[Any] = [
+        *ensure_list(inputs.get("artifact_links")),
+        *parse_artifacts(args.artifact),
+        *ensure_list(parse_json_arg(args.artifacts_json, [])),
+    ]
     if meta.get("run_url"):
-        normalized_artifacts = normalize_artifacts(
-            normalized_artifacts + [{"label": "workflow_run", "url": str(meta["run_url"])}]
-        )
+        artifacts.append({"label": "workflow_run", "url": str(meta["run_url"])})
+    normalized_artifacts = normalize_artifacts(artifacts)
 
     row_counts = ensure_dict(inputs.get("row_counts")).copy()
     row_counts.update(parse_row_counts(args.row_count))
@@ -286,7 +315,12 @@ def build_probe(args: argparse.Namespace) -> dict[str, Any]:
 
 def write_probe(path: Path, payload: dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+        return
+    with path.open("w", encoding="utf-8") as fh:
+        json.dump(payload, fh, indent=2, ensure_ascii=False)
+        fh.write("\n")
 
 
 def main() -> int:
@@ -1,18 +1,52 @@
 #!/usr/bin/env python3
+import argparse
 import csv
+import gzip
+import io
 import json
+import pickle
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import lru_cache, partial
 from html.parser import HTMLParser
 from pathlib import Path
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:  # pragma: no cover - optional dependency
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:  # pragma: no cover - optional dependency
+    SelectolaxParser = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:  # pragma: no cover - optional dependency
+    requests = None
+
 ROOT = Path(__file__).resolve().parents[1]
 INPUT_CSV = ROOT / 'data' / 'listed developer list.csv'
 OUTPUT_JSON = ROOT / 'data' / 'processed' / 'developer_ratios_history.json'
 CACHE_DIR = ROOT / 'data' / 'cache' / 'stockanalysis'
+MAX_WORKERS = 8
+CACHE_MAX_AGE_SECONDS = 6 * 60 * 60
+PRINT_LOCK = threading.Lock()
+USER_AGENT = 'Mozilla/5.0 (SGDevelopersHealthMonitor/1.0)'
 
 METRICS = {
     'marketCap': {'label': 'Market Capitalization', 'aliases': ['Market Capitalization'], 'unit': 'millions SGD'},
@@ -28,19 +62,43 @@ METRICS = {
     'assetTurnover': {'label': 'Asset Turnover', 'aliases': ['Asset Turnover', 'Asset Turnover Ratio']},
 }
 
-MISSING_RE = re.compile(r'^(?:-|--|n/?a|na|none|null)?$', re.I)
+MISSING_VALUES = frozenset({'', '-', '--', 'n/a', 'na', 'none', 'null'})
+NUMERIC_DROP_TABLE = str.maketrans('', '', ',× \xa0')
+WS_RE = re.compile(r'\s+')
+PAREN_RE = re.compile(r'\(.*?\)')
+NON_LABEL_CHARS_RE = re.compile(r'[^a-z0-9/% ]')
+TRAILING_RATIO_RE = re.compile(r' ratio$')
+LEADING_ALPHA_RE = re.compile(r'^[A-Za-z$]+')
+FISCAL_YEAR_RE = re.compile(r'^(?:FY\s*)?(20\d{2})$', re.I)
+
+
+def dump_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+    return json.dumps(payload, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def load_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def now_iso():
     return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
 
 
+def mtime_iso(path):
+    return datetime.fromtimestamp(path.stat().st_mtime, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+@lru_cache(maxsize=1024)
 def normalize_label(value: str) -> str:
     text = (value or '').lower()
-    text = re.sub(r'\(.*?\)', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'[^a-z0-9/% ]', '', text)
-    text = re.sub(r' ratio$', '', text)
+    text = PAREN_RE.sub('', text)
+    text = WS_RE.sub(' ', text)
+    text = NON_LABEL_CHARS_RE.sub('', text)
+    text = TRAILING_RATIO_RE.sub('', text)
     return text.strip()
 
 
@@ -56,7 +114,7 @@ class TableParser(HTMLParser):
         self.in_cell = False
         self.curr_table = []
         self.curr_row = []
-        self.curr_cell = []
+        self.curr_cell = io.StringIO()
 
     def handle_starttag(self, tag, attrs):
         t = tag.lower()
@@ -68,16 +126,16 @@ class TableParser(HTMLParser):
             self.curr_row = []
         elif self.in_row and t in ('th', 'td'):
             self.in_cell = True
-            self.curr_cell = []
+            self.curr_cell = io.StringIO()
 
     def handle_data(self, data):
         if self.in_cell:
-            self.curr_cell.append(data)
+            self.curr_cell.write(data)
 
     def handle_endtag(self, tag):
         t = tag.lower()
         if t in ('th', 'td') and self.in_cell:
-            cell = re.sub(r'\s+', ' ', ''.join(self.curr_cell)).strip()
+            cell = WS_RE.sub(' ', self.curr_cell.getvalue()).strip()
             self.curr_row.append(cell)
             self.in_cell = False
         elif t == 'tr' and self.in_row:
@@ -90,15 +148,63 @@ class TableParser(HTMLParser):
             self.in_table = False
 
 
+def extract_tables(html):
+    if lxml is not None:
+        return extract_tables_lxml(html)
+    if SelectolaxParser is not None:
+        return extract_tables_selectolax(html)
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    parser = TableParser()
+    parser.feed(html)
+    return parser.tables
+
+
+def extract_tables_lxml(html):
+    try:
+        if isinstance(html, bytes):
+            # Pages are UTF-8; not every page declares it, and libxml2 would otherwise guess.
+            # Parsers are not shared between worker threads, so build one per call.
+            doc = lxml.html.fromstring(html, parser=lxml.html.HTMLParser(encoding='utf-8'))
+        else:
+            doc = lxml.html.fromstring(html)
+    except lxml.etree.ParserError:
+        # Empty or element-less documents; the other backends just find no tables.
+        return []
+    tables = []
+    for table in doc.iter('table'):
+        rows = []
+        for tr in table.iter('tr'):
+            row = [WS_RE.sub(' ', c.text_content()).strip() for c in tr.iterchildren('td', 'th')]
+            if row:
+                rows.append(row)
+        if rows:
+            tables.append(rows)
+    return tables
+
+
+def extract_tables_selectolax(html):
+    tables = []
+    for table in SelectolaxParser(html).css('table'):
+        rows = []
+        for tr in table.css('tr'):
+            row = [WS_RE.sub(' ', c.text()).strip() for c in tr.iter() if c.tag in ('td', 'th')]
+            if row:
+                rows.append(row)
+        if rows:
+            tables.append(rows)
+    return tables
+
+
 def parse_numeric(raw):
     if raw is None:
         return None
-    t = str(raw).replace('\xa0', ' ').strip()
-    if not t or MISSING_RE.match(t):
+    t = str(raw).strip()
+    if t.lower() in MISSING_VALUES:
         return None
-    cleaned = t.replace(',', '').replace('×', '').replace(' ', '')
-    cleaned = re.sub(r'^[A-Za-z$]+', '', cleaned)
-    cleaned = cleaned.rstrip('%')
+    cleaned = t.translate(NUMERIC_DROP_TABLE).rstrip('%')
+    if cleaned[:1].isalpha() or cleaned[:1] == '$':
+        cleaned = LEADING_ALPHA_RE.sub('', cleaned)
     try:
         return float(cleaned)
     except ValueError:
@@ -111,7 +217,7 @@ def parse_period_label(label):
         return None
     if txt.lower() == 'current':
         return 'Current'
-    m = re.match(r'^(?:FY\s*)?(20\d{2})$', txt, re.I)
+    m = FISCAL_YEAR_RE.match(txt)
     if m:
         return f"FY {m.group(1)}"
     return txt
@@ -124,14 +230,19 @@ def empty_metrics():
     }
 
 
-def parse_ratios_from_html(html):
-    parser = TableParser()
-    parser.feed(html)
+def find_header_index(table):
+    current_idx = -1
+    for i, row in enumerate(table):
+        if row and row[0].lower().startswith('ratio'):
+            return i
+        if current_idx < 0 and any('current' in c.lower() for c in row):
+            current_idx = i
+    return current_idx
 
-    for table in parser.tables:
-        header_idx = next((i for i, row in enumerate(table) if row and row[0].lower().startswith('ratio')), -1)
-        if header_idx < 0:
-            header_idx = next((i for i, row in enumerate(table) if any('current' in c.lower() for c in row)), -1)
+
+def parse_ratios_from_html(html):
+    for table in extract_tables(html):
+        header_idx = find_header_index(table)
         if header_idx < 0:
             continue
 
@@ -168,67 +279,159 @@ def parse_ratios_from_html(html):
     raise ValueError('Unable to locate StockAnalysis ratios table')
 
 
-def fetch_html(url, retries=3):
+def build_session():
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'})
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retry)
+    session.mount('https://', adapter)
+    return session
+
+
+SESSION = build_session() if requests is not None else None
+
+
+def conditional_headers(validators):
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('lastModified'):
+        headers['If-Modified-Since'] = validators['lastModified']
+    return headers
+
+
+def response_validators(headers):
+    return {'etag': headers.get('ETag'), 'lastModified': headers.get('Last-Modified')}
+
+
+def fetch_html(url, validators=None, retries=3):
+    """Return (raw_html, validators); raw_html is None when the server answers 304 Not Modified."""
+    headers = conditional_headers(validators or {})
+    if SESSION is not None:
+        resp = SESSION.get(url, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            return None, response_validators(resp.headers)
+        resp.raise_for_status()
+        return resp.content, response_validators(resp.headers)
+
     last_err = None
     for attempt in range(1, retries + 1):
         try:
-            req = Request(url, headers={'User-Agent': 'Mozilla/5.0 (SGDevelopersHealthMonitor/1.0)'})
+            req = Request(url, headers={'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip', **headers})
             with urlopen(req, timeout=30) as resp:
-                return resp.read().decode('utf-8', errors='replace')
-        except (HTTPError, URLError, TimeoutError) as exc:
+                body = resp.read()
+                if resp.headers.get('Content-Encoding', '').lower() == 'gzip':
+                    body = gzip.decompress(body)
+                return body, response_validators(resp.headers)
+        except HTTPError as exc:
+            if exc.code == 304:
+                return None, response_validators(exc.headers)
             last_err = exc
-            if attempt < retries:
-                time.sleep(0.5 * (2 ** (attempt - 1)))
+        except (URLError, TimeoutError) as exc:
+            last_err = exc
+        if attempt < retries:
+            time.sleep(0.5 * (2 ** (attempt - 1)))
     raise last_err
 
 
+def is_fresh(path):
+    return path.exists() and time.time() - path.stat().st_mtime < CACHE_MAX_AGE_SECONDS
+
+
+def read_validators(path):
+    try:
+        return load_json(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def load_parsed(ticker, url, fetched_at, force_refresh=False, emit_json_cache=False):
+    """Return (parsed, fetched_at); cache hits report when the cached parse was last fetched or revalidated."""
+    # The pickle is a trusted, locally written cache; it is never fetched from elsewhere.
+    cache_pickle = CACHE_DIR / f'{ticker}.pkl'
+    validators_json = CACHE_DIR / f'{ticker}.validators.json'
+    if not force_refresh and is_fresh(cache_pickle):
+        return pickle.loads(cache_pickle.read_bytes()), mtime_iso(cache_pickle)
+
+    validators = {} if force_refresh or not cache_pickle.exists() else read_validators(validators_json)
+    raw_html, validators = fetch_html(url, validators)
+    if raw_html is None:
+        cache_pickle.touch()
+        return pickle.loads(cache_pickle.read_bytes()), mtime_iso(cache_pickle)
+
+    (CACHE_DIR / f'{ticker}.html').write_bytes(raw_html)
+    parsed = parse_ratios_from_html(raw_html)
+    cache_pickle.write_bytes(pickle.dumps(parsed, protocol=5))
+    if emit_json_cache:
+        (CACHE_DIR / f'{ticker}.json').write_bytes(dump_json(parsed))
+    validators_json.write_bytes(dump_json(validators))
+    return parsed, fetched_at
+
+
+def log(message):
+    with PRINT_LOCK:
+        print(message)
+
+
+def process_row(row, fetched_at, force_refresh=False, emit_json_cache=False):
+    ticker = (row.get('stockanalysis_symbol') or row.get('sgx_ticker') or '').strip().upper()
+    url = (row.get('stockanalysis_ratios_url') or '').strip()
+    record = {
+        'ticker': ticker,
+        'name': row.get('company_name', ''),
+        'stockanalysis_ratios_url': url,
+        'periods': [],
+        'metrics': empty_metrics(),
+        'lastFetchedAt': fetched_at,
+        'fetchStatus': 'error',
+        'fetchError': None,
+    }
+
+    try:
+        if not url:
+            raise ValueError('Missing stockanalysis_ratios_url')
+        parsed, record['lastFetchedAt'] = load_parsed(ticker, url, fetched_at, force_refresh, emit_json_cache)
+        record['periods'] = parsed['periods']
+        record['metrics'] = parsed['metrics']
+        captured = sum(1 for m in parsed['metrics'].values() if m['values'])
+        record['fetchStatus'] = 'ok' if captured == len(METRICS) else 'partial'
+        if ticker == '9CI':
+            labels = ', '.join([p['label'] for p in parsed['periods']])
+            log(f'[debug 9CI] periods={labels}; metricsCaptured={captured}')
+        log(f'[{ticker}] {record["fetchStatus"]}')
+    except Exception as exc:
+        record['fetchStatus'] = 'error'
+        record['fetchError'] = str(exc)
+        log(f'[{ticker}] error: {exc}')
+
+    return record
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Build developer ratio history from StockAnalysis.')
+    parser.add_argument('--force-refresh', action='store_true', help='Ignore cached parses and refetch every ticker')
+    parser.add_argument('--emit-json-cache', action='store_true', help='Also write <ticker>.json parse caches for inspection')
+    args = parser.parse_args()
+
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
     OUTPUT_JSON.parent.mkdir(parents=True, exist_ok=True)
 
-    with INPUT_CSV.open(newline='', encoding='utf-8') as f:
-        rows = list(csv.DictReader(f))
-
-    out = {'updatedAt': now_iso(), 'source': 'stockanalysis', 'developers': []}
-
-    for row in rows:
-        ticker = (row.get('stockanalysis_symbol') or row.get('sgx_ticker') or '').strip().upper()
-        url = (row.get('stockanalysis_ratios_url') or '').strip()
-        record = {
-            'ticker': ticker,
-            'name': row.get('company_name', ''),
-            'stockanalysis_ratios_url': url,
-            'periods': [],
-            'metrics': empty_metrics(),
-            'lastFetchedAt': now_iso(),
-            'fetchStatus': 'error',
-            'fetchError': None,
-        }
-
-        try:
-            if not url:
-                raise ValueError('Missing stockanalysis_ratios_url')
-            html = fetch_html(url)
-            (CACHE_DIR / f'{ticker}.html').write_text(html, encoding='utf-8')
-            parsed = parse_ratios_from_html(html)
-            record['periods'] = parsed['periods']
-            record['metrics'] = parsed['metrics']
-            captured = sum(1 for m in parsed['metrics'].values() if m['values'])
-            record['fetchStatus'] = 'ok' if captured == len(METRICS) else 'partial'
-            (CACHE_DIR / f'{ticker}.json').write_text(json.dumps(parsed, indent=2), encoding='utf-8')
-            if ticker == '9CI':
-                labels = ', '.join([p['label'] for p in parsed['periods']])
-                print(f'[debug 9CI] periods={labels}; metricsCaptured={captured}')
-            print(f'[{ticker}] {record["fetchStatus"]}')
-        except Exception as exc:
-            record['fetchStatus'] = 'error'
-            record['fetchError'] = str(exc)
-            print(f'[{ticker}] error: {exc}')
-
-        out['developers'].append(record)
-
-    out['updatedAt'] = now_iso()
-    OUTPUT_JSON.write_text(json.dumps(out, indent=2), encoding='utf-8')
+    run_ts = now_iso()
+    worker = partial(
+        process_row,
+        fetched_at=run_ts,
+        force_refresh=args.force_refresh,
+        emit_json_cache=args.emit_json_cache,
+    )
+
+    # Rows are submitted as the CSV streams in; collecting futures in submission
+    # order keeps the output JSON deterministic.
+    with INPUT_CSV.open(newline='', encoding='utf-8') as f, ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = [ex.submit(worker, row) for row in csv.DictReader(f)]
+    developers = [future.result() for future in futures]
+
+    out = {'updatedAt': now_iso(), 'source': 'stockanalysis', 'developers': developers}
+    OUTPUT_JSON.write_bytes(dump_json(out))
     print(f'Wrote {OUTPUT_JSON}')
 
 